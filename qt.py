@@ -9,6 +9,12 @@ import threading
 import signal
 import re
 import math
+import html
+import itertools
+import select
+from collections import deque
+from datetime import datetime
+import time
 
 
 # 在导入任何ROS包之前设置ROS环境变量
@@ -52,12 +58,16 @@ warnings.filterwarnings('ignore', category=DeprecationWarning)
 import numpy as np
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                              QHBoxLayout, QPushButton, QLabel, QLineEdit,
-                             QGroupBox, QFileDialog, QMessageBox, QTextEdit)
-from PyQt5.QtCore import Qt, pyqtSignal, QThread, pyqtSlot, QTimer
-from PyQt5.QtGui import QFont, QTextCursor, QColor
+                             QGroupBox, QFileDialog, QMessageBox, QPlainTextEdit,
+                             QProgressBar)
+from PyQt5.QtCore import Qt, pyqtSignal, QObject, QThread, pyqtSlot, QTimer
+from PyQt5.QtGui import QFont
 import pyqtgraph as pg
 from pyqtgraph import Vector
 import pyqtgraph.opengl as gl
+from pyqtgraph.opengl.GLGraphicsItem import GLGraphicsItem
+from OpenGL import GL
+from OpenGL.GL import shaders
 
 # ROS相关导入
 try:
@@ -79,18 +89,231 @@ except ImportError:
     HAS_OPEN3D = False
     print("警告: 未安装open3d库，将使用模拟数据。请安装: pip install open3d")
 
+# pandas可选，用于快速读取文本格式的点云
+try:
+    import pandas as pd
+
+    HAS_PANDAS = True
+except ImportError:
+    HAS_PANDAS = False
 
-class ROSSubscriberThread(QThread):
-    """ROS订阅线程"""
-    pose_signal = pyqtSignal(float, float, float, float, float, float)  # x, y, z, roll, pitch, yaw
+# numba可选，用于加速四元数转欧拉角
+try:
+    from numba import njit, prange
+
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+# 终端输出清理用的正则：ANSI转义序列 | 终端标题设置 | 残留的颜色代码，一次扫描完成
+_ANSI_ESC = re.compile(rb'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])|\]2;.*?\x07|\[[\d;]*m')
+# 终端输出行分类：包含 [ERROR] 或 [WARN 的行按错误信息处理
+_CLASS_RE = re.compile(rb'\[ERROR\]|\[WARN')
+# 不影响功能的警告（磁盘空间提示、rviz插件），按普通信息显示
+_DOWNGRADE_RE = re.compile(rb'(?i:disk usage|rosclean)|jsk_rviz_plugin')
+# 终端显示着色用，分组名对应颜色表的键
+_LEVEL_RE = re.compile(r'\[(?P<ERROR>ERROR)\]|\[(?P<WARN>WARN)')
+
+
+def quaternion_to_rpy(x, y, z, w):
+    """四元数转欧拉角 (roll, pitch, yaw)，单位为弧度"""
+    roll = math.atan2(2.0 * (w * x + y * z), 1.0 - 2.0 * (x * x + y * y))
+    sinp = max(-1.0, min(1.0, 2.0 * (w * y - z * x)))
+    pitch = math.asin(sinp)
+    yaw = math.atan2(2.0 * (w * z + x * y), 1.0 - 2.0 * (y * y + z * z))
+    return roll, pitch, yaw
+
+
+if HAS_NUMBA:
+    # 编译为机器码并缓存到磁盘，导入时先调用一次完成编译
+    quaternion_to_rpy = njit(cache=True, fastmath=True)(quaternion_to_rpy)
+    quaternion_to_rpy(0.0, 0.0, 0.0, 1.0)
+
+
+def _point_cloud_stats_numpy(pts):
+    """point_cloud_stats的numpy实现"""
+    return pts.min(axis=0), pts.max(axis=0), pts.mean(axis=0, dtype=np.float64)
+
+
+if HAS_NUMBA:
+    @njit(cache=True, parallel=True)
+    def _point_cloud_stats_kernel(pts):
+        """point_cloud_stats的并行实现"""
+        # 按行分块并行，每块独立累计，最后合并；只扫描一遍数据
+        n = pts.shape[0]
+        n_blocks = min(n, 64)
+        block_mins = np.empty((n_blocks, 3))
+        block_maxs = np.empty((n_blocks, 3))
+        block_sums = np.zeros((n_blocks, 3))
+        for b in prange(n_blocks):
+            start = b * n // n_blocks
+            end = (b + 1) * n // n_blocks
+            for j in range(3):
+                block_mins[b, j] = pts[start, j]
+                block_maxs[b, j] = pts[start, j]
+            for i in range(start, end):
+                for j in range(3):
+                    v = pts[i, j]
+                    if v < block_mins[b, j]:
+                        block_mins[b, j] = v
+                    if v > block_maxs[b, j]:
+                        block_maxs[b, j] = v
+                    block_sums[b, j] += v
+
+        mins = np.empty(3)
+        maxs = np.empty(3)
+        mean = np.empty(3)
+        for j in range(3):
+            mins[j] = block_mins[:, j].min()
+            maxs[j] = block_maxs[:, j].max()
+            mean[j] = block_sums[:, j].sum() / n
+        return mins, maxs, mean
+
+    # numba的workqueue线程层不允许多个线程同时启动并行内核，调用必须串行
+    _STATS_LOCK = threading.Lock()
+
+    def point_cloud_stats(pts):
+        """计算点云的逐轴最小值、最大值和均值 (mins, maxs, mean)，pts不能为空"""
+        with _STATS_LOCK:
+            return _point_cloud_stats_kernel(pts)
+
+    point_cloud_stats(np.zeros((1, 3), dtype=np.float32))
+else:
+    point_cloud_stats = _point_cloud_stats_numpy
+
+
+VOXEL_MAX_ITER = 4  # 体素下采样调整体素大小的最多次数
+
+
+def sample_indices(rng, n, k):
+    """从n个点中无放回随机抽取k个，返回升序索引"""
+    # Generator.choice不会像np.random.choice那样对整个arange(n)洗牌；升序索引使取点按内存顺序访问
+    indices = rng.choice(n, k, replace=False, shuffle=False)
+    indices.sort()
+    return indices
+
+
+def to_gl_array(pts):
+    """转换为GL上传使用的连续float32数组，已满足要求时直接返回原数组"""
+    return np.ascontiguousarray(pts, dtype=np.float32)
+
+
+def _effective_cells(occupied, n):
+    """n个点均匀落入C个体素时期望占用 C*(1-exp(-n/C)) 个体素，由实测占用数反推C"""
+    if occupied >= n:
+        return float(n) * n  # 所有点各占一个体素，按远大于n的体素数处理
+    lo, hi = float(occupied), float(n) * n
+    for _ in range(50):
+        mid = math.sqrt(lo * hi)
+        if -mid * math.expm1(-n / mid) < occupied:
+            lo = mid
+        else:
+            hi = mid
+    return lo
+
+
+def voxel_downsample(pts, target, rng, stats=None):
+    """体素栅格下采样，保留的点数不超过target（stats为point_cloud_stats的结果，可省略）"""
+    mins, maxs, _ = stats if stats is not None else point_cloud_stats(pts)
+    mins = mins.astype(np.float32)
+    extents = (maxs - mins).astype(np.float64)
+    ranges = np.sort(extents)
+    # 地图点云基本是2.5D的，按最大的两个维度的面积估算体素边长
+    area = float(ranges[2]) * max(float(ranges[1]), 1e-6)
+    voxel = math.sqrt(area / target)
+    if voxel <= 0:
+        return pts[sample_indices(rng, len(pts), target)]
+
+    pcd = None
+    if HAS_OPEN3D:
+        pcd = o3d.geometry.PointCloud()
+        pcd.points = o3d.utility.Vector3dVector(pts.astype(np.float64))
+
+    n = len(pts)
+    target_cells = _effective_cells(target, n)
+    last = None  # 上一次的 (体素边长, 等效体素数)，用于估计体素数随边长变化的幂次
+    for _ in range(VOXEL_MAX_ITER):
+        if pcd is not None:
+            sampled = np.asarray(pcd.voxel_down_sample(voxel).points, dtype=np.float32)
+            occupied = len(sampled)
+        else:
+            # 每个体素保留一个代表点：整数体素坐标按行优先压成一个int64线性编号（无冲突）；
+            # 先只排序统计占用的体素数，达到目标后才做代价更高的argsort取点
+            keys, voxel = _voxel_keys(pts, mins, extents, voxel)
+            sorted_keys = np.sort(keys)
+            occupied = int(np.count_nonzero(sorted_keys[1:] != sorted_keys[:-1])) + 1
+            sampled = None
+        if occupied <= target:
+            return sampled if sampled is not None else _voxel_representatives(pts, keys, sorted_keys)
+
+        # 点数超出目标，按实测的占用体素数放大体素边长后重试。
+        # 点数接近总点数时大部分体素只有一个点，先换算成等效体素数，避免放大不足
+        cells = _effective_cells(occupied, n)
+        # 有两次测量时用它们估计体素数随边长变化的幂次，否则按点云厚度是否超过体素判断是体还是面
+        if last is not None and cells < last[1]:
+            dim = math.log(last[1] / cells) / math.log(voxel / last[0])
+            dim = min(max(dim, 1.0), 3.0)
+        else:
+            dim = 3.0 if ranges[0] > voxel else 2.0
+        last = (voxel, cells)
+        voxel *= (cells / target_cells) ** (1.0 / dim) * 1.05
+
+    # 多次重试后仍超出目标，随机抽取剩余部分
+    if sampled is None:
+        sampled = _voxel_representatives(pts, keys, sorted_keys)
+    return sampled[sample_indices(rng, len(sampled), target)]
+
+
+def _voxel_keys(pts, mins, extents, voxel):
+    """计算每个点所在体素的int64线性编号，返回 (编号, 实际使用的体素边长)"""
+    dims = [int(e // voxel) + 1 for e in extents]
+    while dims[0] * dims[1] * dims[2] >= 2 ** 63:
+        voxel *= 2.0  # 编号会溢出int64时放大体素
+        dims = [int(e // voxel) + 1 for e in extents]
+    cells = np.floor((pts - mins) / voxel).astype(np.int64)
+    np.clip(cells, 0, np.array(dims, dtype=np.int64) - 1, out=cells)
+    return (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2], voxel
+
+
+def _voxel_representatives(pts, keys, sorted_keys):
+    """每个体素取一个点，按原顺序返回"""
+    order = np.argsort(keys)
+    first = np.empty(len(keys), dtype=bool)
+    first[0] = True
+    np.not_equal(sorted_keys[1:], sorted_keys[:-1], out=first[1:])
+    return pts[np.sort(order[first])]
+
+
+class ROSSubscriberThread(QObject):
+    """ROS订阅线程（普通守护线程，位姿通过环形缓冲交给主线程，低频事件走Qt信号）"""
     error_signal = pyqtSignal(str)
     connected_signal = pyqtSignal()  # 连接成功信号
 
-    def __init__(self, topic_name="/kalman_filtered_pose"):
+    POSE_RING_SIZE = 16  # 缓存的最近位姿数量
+    SUBSCRIBER_BUFF_SIZE = 4 * 1024 * 1024  # rospy接收缓冲大小（字节）
+
+    def __init__(self, topic_name="/kalman_filtered_pose", quaternion_orientation=False):
         super().__init__()
         self.topic_name = topic_name
+        self.quaternion_orientation = quaternion_orientation  # orientation是否为标准四元数
         self.is_running = False
         self.subscriber = None
+        self._stop_event = threading.Event()
+        self._thread = None
+        # 单生产者单消费者环形缓冲，元素为 (x, y, z, roll, pitch, yaw)
+        self.pose_ring = deque(maxlen=self.POSE_RING_SIZE)
+
+    def start(self):
+        """启动后台守护线程"""
+        self._thread = threading.Thread(target=self.run, name="ros-pose-subscriber", daemon=True)
+        self._thread.start()
+
+    def wait(self, msecs=None):
+        """等待后台线程结束（与QThread.wait一样以毫秒为单位，None为一直等待），返回线程是否已结束"""
+        if self._thread is not None:
+            self._thread.join(None if msecs is None else msecs / 1000)
+            return not self._thread.is_alive()
+        return True
 
     def run(self):
         """在后台线程中运行ROS节点"""
@@ -114,19 +337,20 @@ class ROSSubscriberThread(QThread):
                 rospy.init_node('pcd_viewer_pose_subscriber', anonymous=True, disable_signals=True)
                 print("ROS节点初始化成功")
 
-            # 创建订阅者
-            self.subscriber = rospy.Subscriber(self.topic_name, PoseStamped, self.pose_callback, queue_size=10)
+            # 创建订阅者：只保留最新一帧，关闭Nagle算法，回调中直接写入环形缓冲
+            # rospy的queue_size只在buff_size之内生效：buff_size过小时旧消息会积压在socket缓冲中，
+            # 与roscpp行为不一致，因此buff_size要足够容纳积压的整段消息流
+            self.subscriber = rospy.Subscriber(self.topic_name, PoseStamped, self.pose_callback,
+                                               queue_size=1, buff_size=self.SUBSCRIBER_BUFF_SIZE,
+                                               tcp_nodelay=True)
 
             self.is_running = True
             self.connected_signal.emit()  # 发送连接成功信号
             print(f"开始订阅话题: {self.topic_name}")
 
-            # 保持节点运行
-            rate = rospy.Rate(30)  # 30Hz
-            while self.is_running and not rospy.is_shutdown():
-                try:
-                    rate.sleep()
-                except rospy.ROSInterruptException:
+            # 保持节点运行（回调在rospy自己的接收线程中执行，这里只需阻塞等待停止）
+            while not self._stop_event.wait(0.5):
+                if rospy.is_shutdown():
                     break
 
         except Exception as e:
@@ -145,13 +369,16 @@ class ROSSubscriberThread(QThread):
             y = msg.pose.position.y
             z = msg.pose.position.z
 
-            # 根据用户描述，orientation的xyz对应roll, pitch, yaw
-            roll = msg.pose.orientation.x
-            pitch = msg.pose.orientation.y
-            yaw = msg.pose.orientation.z
+            q = msg.pose.orientation
+            if self.quaternion_orientation:
+                # 标准PoseStamped：orientation为单位四元数
+                roll, pitch, yaw = quaternion_to_rpy(q.x, q.y, q.z, q.w)
+            else:
+                # 根据用户描述，orientation的xyz对应roll, pitch, yaw
+                roll, pitch, yaw = q.x, q.y, q.z
 
-            # 发送信号到主线程更新UI
-            self.pose_signal.emit(x, y, z, roll, pitch, yaw)
+            # 写入环形缓冲，由主线程定时读取（deque.append在CPython中是原子操作）
+            self.pose_ring.append((x, y, z, roll, pitch, yaw))
 
         except Exception as e:
             self.error_signal.emit(f"解析位姿数据失败: {str(e)}")
@@ -159,6 +386,7 @@ class ROSSubscriberThread(QThread):
     def stop(self):
         """停止ROS订阅"""
         self.is_running = False
+        self._stop_event.set()
         if self.subscriber:
             try:
                 self.subscriber.unregister()
@@ -166,15 +394,38 @@ class ROSSubscriberThread(QThread):
                 pass
 
         # 不要在这里调用rospy.signal_shutdown()，因为可能影响其他ROS操作
-        self.quit()
 
 
 class ROSLauncherThread(QThread):
     """ROS启动线程"""
     output_signal = pyqtSignal(str)
     error_signal = pyqtSignal(str)
+    notice_signal = pyqtSignal(str)  # 可忽略的警告，不参与启动状态判断
     finished_signal = pyqtSignal(bool)
 
+    READ_CHUNK_SIZE = 4096  # 每次最多读取的字节数
+    FLUSH_INTERVAL = 0.01  # 每次等待输出的最长时间（秒）
+    EMIT_INTERVAL = 0.05  # 输出攒批发送的间隔（秒），日志刷屏时合并为少量信号
+    EMIT_BYTES = 64 * 1024  # 攒够该字节数时立即发送
+
+    _env_cache = {}  # NDT路径 -> source devel/setup.bash 之后的环境变量
+
+    @classmethod
+    def load_workspace_env(cls, ndt_path):
+        """获取source工作空间setup.bash后的环境变量，每个路径只解析一次"""
+        env = cls._env_cache.get(ndt_path)
+        if env is None:
+            output = subprocess.check_output(
+                ['bash', '-c', 'source devel/setup.bash && env -0'], cwd=ndt_path
+            )
+            env = {}
+            for item in output.split(b'\0'):
+                key, sep, value = item.decode('utf-8', errors='replace').partition('=')
+                if sep:
+                    env[key] = value
+            cls._env_cache[ndt_path] = env
+        return env
+
     def __init__(self, ndt_path="/media/dzt/pym/NDT"):
         super().__init__()
         self.ndt_path = ndt_path
@@ -190,52 +441,64 @@ class ROSLauncherThread(QThread):
                 self.finished_signal.emit(False)
                 return
 
-            # 构建命令 - 设置环境变量避免一些警告
-            cmd = f"""cd {self.ndt_path} && \
-                     source devel/setup.bash && \
-                     export ROSCONSOLE_FORMAT='[${{severity}}] [${{time}}]: ${{message}}' && \
-                     roslaunch ndt_localizer ndt_localizer.launch"""
+            # 直接启动roslaunch，不再经过shell
+            cmd = ['roslaunch', 'ndt_localizer', 'ndt_localizer.launch']
 
             self.output_signal.emit(f"正在启动NDT定位器...\n路径: {self.ndt_path}\n")
-            self.output_signal.emit("执行命令:\n" + cmd.replace("\\", "").strip() + "\n")
+            self.output_signal.emit("执行命令:\n" + " ".join(cmd) + "\n")
 
-            # 使用subprocess执行命令，设置环境变量
-            env = os.environ.copy()
+            # 使用缓存的ROS工作空间环境，设置环境变量避免一些警告
+            env = dict(self.load_workspace_env(self.ndt_path))
+            env['ROSCONSOLE_FORMAT'] = '[${severity}] [${time}]: ${message}'
             env['PYTHONUNBUFFERED'] = '1'  # 确保Python输出不缓冲
 
             self.process = subprocess.Popen(
                 cmd,
-                shell=True,
+                cwd=self.ndt_path,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.STDOUT,  # 将stderr重定向到stdout
-                text=True,
-                executable='/bin/bash',
-                preexec_fn=os.setsid,  # 创建新的进程组
+                start_new_session=True,  # 创建新的进程组
                 env=env,
-                bufsize=1,  # 行缓冲
-                universal_newlines=True
+                bufsize=0  # 不缓冲，直接按块读取原始字节
             )
 
             self.is_running = True
 
-            # 实时读取输出
-            for line in iter(self.process.stdout.readline, ''):
-                if not self.is_running:
-                    break
-
-                if line:
-                    # 清理ANSI转义序列和其他控制字符
-                    cleaned_line = self.clean_ansi_codes(line.strip())
-                    if cleaned_line:
-                        # 检测是否是错误信息
-                        if '[ERROR]' in cleaned_line or '[WARN' in cleaned_line:
-                            self.error_signal.emit(cleaned_line)
-                        else:
-                            self.output_signal.emit(cleaned_line)
-
-                # 检查进程是否结束
-                if self.process.poll() is not None:
-                    break
+            # 非阻塞按块读取输出，攒够一批（约64KB或50ms）再统一清理和发送
+            fd = self.process.stdout.fileno()
+            os.set_blocking(fd, False)
+            pending = bytearray()
+            last_flush = time.monotonic()
+            eof = False
+
+            while self.is_running and not eof:
+                ready, _, _ = select.select([fd], [], [], self.FLUSH_INTERVAL)
+                if ready:
+                    try:
+                        chunk = os.read(fd, self.READ_CHUNK_SIZE)
+                    except BlockingIOError:
+                        chunk = None
+                    if chunk == b'':
+                        eof = True
+                    elif chunk:
+                        pending += chunk
+                elif self.process.poll() is not None:
+                    # 进程已结束且没有更多输出
+                    eof = True
+
+                now = time.monotonic()
+                if pending and (eof or len(pending) >= self.EMIT_BYTES
+                                or now - last_flush >= self.EMIT_INTERVAL):
+                    # 只处理完整的行（\r也算行尾，与原先的通用换行一致），末尾不完整的行留到下一批；
+                    # 缓冲超过EMIT_BYTES仍没有行尾时整批发送，避免无限增长
+                    if eof or len(pending) >= self.EMIT_BYTES:
+                        end = len(pending)
+                    else:
+                        end = max(pending.rfind(b'\n'), pending.rfind(b'\r')) + 1
+                    if end > 0:
+                        self.emit_output(bytes(pending[:end]))
+                        del pending[:end]
+                    last_flush = now
 
             # 等待进程完全结束
             if self.process:
@@ -249,19 +512,33 @@ class ROSLauncherThread(QThread):
         finally:
             self.is_running = False
 
-    def clean_ansi_codes(self, text):
-        """清除ANSI转义序列和其他控制字符"""
-        import re
-        # 移除ANSI颜色代码
-        ansi_escape = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
-        text = ansi_escape.sub('', text)
-        # 移除其他控制字符
-        text = re.sub(r'\]2;.*?\x07', '', text)  # 移除终端标题设置
-        text = re.sub(r'\[[\d;]*m', '', text)  # 移除颜色代码
-        return text.strip()
+    def emit_output(self, data):
+        """清理一批原始输出并发送，连续的普通行合并为一次信号，只在发送时解码"""
+        batch = []
+        for line in self.clean_ansi_codes(data).splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            # 检测是否是错误信息，并在这里过滤掉不重要的警告
+            if _CLASS_RE.search(line):
+                if batch:
+                    self.output_signal.emit(b"\n".join(batch).decode('utf-8', errors='replace'))
+                    batch = []
+                if _DOWNGRADE_RE.search(line):
+                    self.notice_signal.emit(line.decode('utf-8', errors='replace'))
+                else:
+                    self.error_signal.emit(line.decode('utf-8', errors='replace'))
+            else:
+                batch.append(line)
+        if batch:
+            self.output_signal.emit(b"\n".join(batch).decode('utf-8', errors='replace'))
 
-    def stop(self):
-        """停止ROS进程"""
+    def clean_ansi_codes(self, data):
+        """清除ANSI转义序列和其他控制字符（按字节处理）"""
+        return _ANSI_ESC.sub(b'', data).strip()
+
+    def stop(self, timeout=5):
+        """停止ROS进程，timeout为等待SIGTERM生效的秒数，超时后使用SIGKILL"""
         self.is_running = False
         if self.process:
             try:
@@ -269,7 +546,7 @@ class ROSLauncherThread(QThread):
                 os.killpg(os.getpgid(self.process.pid), signal.SIGTERM)
                 self.output_signal.emit("\n定位系统已停止")
                 # 等待进程结束
-                self.process.wait(timeout=5)
+                self.process.wait(timeout=timeout)
             except subprocess.TimeoutExpired:
                 # 如果SIGTERM不起作用，使用SIGKILL
                 try:
@@ -280,9 +557,244 @@ class ROSLauncherThread(QThread):
                 self.error_signal.emit(f"停止进程时出错: {str(e)}")
 
 
+class PCDLoaderThread(QThread):
+    """点云文件加载线程：分块读取，每读完一块就发送给主线程渐进显示，读完后在线程中统计并下采样"""
+    # 每个信号的第一个参数是本次加载的编号，主线程据此丢弃已取消的加载发来的信号
+    total_signal = pyqtSignal(int, int)  # 预计总点数
+    chunk_signal = pyqtSignal(int, object)  # 新读取的一块点 (N, 3) float32
+    loaded_signal = pyqtSignal(int, object, object, object)  # 全部点, 用于显示的点, point_cloud_stats结果
+    error_signal = pyqtSignal(int, str)
+
+    CHUNK_POINTS = 200000  # 每块点数
+    CACHE_SUFFIX = '.f32.npy'  # float32缓存文件后缀
+
+    # PCD字段类型 -> numpy类型字符
+    _PCD_TYPES = {'F': 'f', 'I': 'i', 'U': 'u'}
+
+    def __init__(self, file_path, display_points=2000000, generation=0):
+        super().__init__()
+        self.file_path = file_path
+        self.generation = generation  # 加载编号
+        self.display_points = display_points  # 超过该点数时下采样后再交给主线程显示
+        self.is_running = False
+        self._rng = np.random.default_rng()  # 下采样用，不与主线程共享
+
+    def run(self):
+        """在后台线程中读取点云文件"""
+        self.is_running = True
+        try:
+            path = self.file_path
+            cache_path = path + self.CACHE_SUFFIX
+            points = self.read_cache(path, cache_path)
+            from_cache = points is not None
+            if not from_cache and self.is_running:
+                points = self.parse_file(path)
+
+            if points is None:
+                return  # 已被取消
+            if len(points) == 0:
+                raise ValueError("点云数据为空")
+
+            print(f"成功读取 {len(points)} 个点")
+
+            if not self.is_running:
+                return
+            # 范围统计和下采样也在后台完成，主线程只负责上传显示
+            stats = point_cloud_stats(points)
+            display_points = points
+            if len(points) > self.display_points:
+                display_points = voxel_downsample(points, self.display_points, self._rng, stats)
+                print(f"点云过大，体素下采样: {len(points)} -> {len(display_points)} 个点")
+            display_points = to_gl_array(display_points)
+            if not self.is_running:
+                return
+            self.loaded_signal.emit(self.generation, points, display_points, stats)
+
+            if not from_cache:
+                self.write_cache(points, cache_path)
+
+        except Exception as e:
+            self.error_signal.emit(self.generation, str(e))
+        finally:
+            self.is_running = False
+
+    def stop(self):
+        """取消加载"""
+        self.is_running = False
+
+    def parse_file(self, path):
+        """按扩展名解析点云文件"""
+        if path.endswith('.pcd'):
+            return self.read_pcd(path)
+        if path.endswith('.ply'):
+            return self.read_open3d(path)
+        if path.endswith(('.txt', '.xyz')):
+            # 读取文本格式的点云文件
+            print(f"读取文本文件：{path}")
+            return self.emit_chunks(self.read_text(path))
+        raise ValueError(f"不支持的文件格式：{path}")
+
+    def read_text(self, path):
+        """读取文本点云的前三列(x,y,z)，有pandas时使用其C解析器"""
+        if HAS_PANDAS:
+            try:
+                return pd.read_csv(path, sep=r'\s+', header=None, usecols=[0, 1, 2], comment='#',
+                                   dtype=np.float32, engine='c').to_numpy()
+            except (pd.errors.ParserError, ValueError):
+                pass  # 格式不规整时交给np.loadtxt，由它给出错误信息
+        data = np.loadtxt(path)
+        if data.ndim != 2 or data.shape[1] < 3:
+            raise ValueError("文本文件格式不正确")
+        return data[:, :3]
+
+    def read_cache(self, path, cache_path):
+        """读取float32缓存文件（内存映射），缓存不存在或已过期时返回None"""
+        try:
+            if os.path.getmtime(cache_path) < os.path.getmtime(path):
+                return None
+            points = np.load(cache_path, mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+        if points.dtype != np.float32 or points.ndim != 2 or points.shape[1] != 3:
+            return None
+
+        print(f"读取点云缓存：{cache_path}")
+        self.total_signal.emit(self.generation, len(points))
+        for start in range(0, len(points), self.CHUNK_POINTS):
+            if not self.is_running:
+                return None
+            self.chunk_signal.emit(self.generation, points[start:start + self.CHUNK_POINTS])
+        return points
+
+    def write_cache(self, points, cache_path):
+        """保存float32缓存文件，下次打开同一文件时直接内存映射读取"""
+        tmp_path = cache_path + '.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.save(f, points)
+            os.replace(tmp_path, cache_path)
+            print(f"已保存点云缓存：{cache_path}")
+        except OSError as e:
+            print(f"保存点云缓存失败: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def read_open3d(self, path):
+        """使用Open3D整体读取，再分块发送"""
+        if not HAS_OPEN3D:
+            raise ValueError(f"读取该文件需要open3d库：{path}")
+        print(f"使用Open3D读取文件：{path}")
+        pcd = o3d.io.read_point_cloud(path)
+        return self.emit_chunks(np.asarray(pcd.points))
+
+    def emit_chunks(self, data):
+        """把已在内存中的点云按块发送，返回去除无效点后的连续float32数组"""
+        total = len(data)
+        self.total_signal.emit(self.generation, total)
+        points = np.empty((total, 3), dtype=np.float32)
+        count = 0
+        for start in range(0, total, self.CHUNK_POINTS):
+            if not self.is_running:
+                return None
+            count = self._store_chunk(points, count, data[start:start + self.CHUNK_POINTS])
+        return points[:count]
+
+    def read_pcd(self, path):
+        """解析PCD文件头，ascii/binary格式直接分块读取，其他格式交给Open3D"""
+        with open(path, 'rb') as f:
+            header = {}
+            while True:
+                line = f.readline()
+                if not line:
+                    raise ValueError("PCD文件头不完整")
+                line = line.decode('ascii', errors='replace').strip()
+                if not line or line.startswith('#'):
+                    continue
+                key, _, value = line.partition(' ')
+                header[key.upper()] = value.split()
+                if key.upper() == 'DATA':
+                    break
+
+            data_format = header['DATA'][0].lower()
+            if data_format not in ('ascii', 'binary'):
+                return self.read_open3d(path)
+
+            fields = header['FIELDS']
+            if not {'x', 'y', 'z'}.issubset(fields):
+                raise ValueError("PCD文件缺少x/y/z字段")
+            sizes = header.get('SIZE', ['4'] * len(fields))
+            types = header.get('TYPE', ['F'] * len(fields))
+            counts = header.get('COUNT', ['1'] * len(fields))
+            total = int(header['POINTS'][0])
+            self.total_signal.emit(self.generation, total)
+
+            points = np.empty((total, 3), dtype=np.float32)
+            count = 0
+
+            if data_format == 'binary':
+                # 字段名可能重复（如 _ 填充字段），重新命名以构造结构化dtype
+                dtype = np.dtype([
+                    (name if name in ('x', 'y', 'z') else f'_{i}',
+                     f'<{self._PCD_TYPES[t]}{sz}', (int(c),) if int(c) > 1 else ())
+                    for i, (name, sz, t, c) in enumerate(zip(fields, sizes, types, counts))
+                ])
+                remaining = total
+                while remaining > 0:
+                    if not self.is_running:
+                        return None
+                    n = min(self.CHUNK_POINTS, remaining)
+                    buf = f.read(n * dtype.itemsize)
+                    n = len(buf) // dtype.itemsize
+                    if n == 0:
+                        break
+                    rec = np.frombuffer(buf, dtype=dtype, count=n)
+                    xyz = np.stack((rec['x'], rec['y'], rec['z']), axis=1)
+                    count = self._store_chunk(points, count, xyz)
+                    remaining -= n
+            else:
+                # ascii格式：每个字段占 COUNT 列，取x/y/z所在的列
+                columns = []
+                col = 0
+                for name, c in zip(fields, counts):
+                    if name in ('x', 'y', 'z'):
+                        columns.append((name, col))
+                    col += int(c)
+                usecols = [c for _, c in sorted(columns, key=lambda item: 'xyz'.index(item[0]))]
+                remaining = total
+                while remaining > 0:
+                    if not self.is_running:
+                        return None
+                    lines = [line.decode('ascii', errors='replace')
+                             for line in itertools.islice(f, min(self.CHUNK_POINTS, remaining))]
+                    if not lines:
+                        break
+                    xyz = np.loadtxt(lines, usecols=usecols, ndmin=2)
+                    count = self._store_chunk(points, count, xyz)
+                    remaining -= len(lines)
+
+        return points[:count]
+
+    def _store_chunk(self, points, count, xyz):
+        """去除NaN点后写入预分配数组并发送，返回新的有效点数"""
+        xyz = xyz[np.isfinite(xyz).all(axis=1)]
+        n = len(xyz)
+        if n:
+            points[count:count + n] = xyz
+            self.chunk_signal.emit(self.generation, points[count:count + n])
+        return count + n
+
+
 class TerminalDialog(QWidget):
     """终端输出对话框"""
 
+    MAX_LINES = 1000  # 终端最多保留的行数
+    FLUSH_INTERVAL = 50  # 批量刷新间隔（毫秒）
+
+    # 错误用红色，警告用橙色显示
+    _COLORS = {'ERROR': '#ff0000', 'WARN': '#ffa500'}
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setWindowTitle("ROS终端输出")
@@ -294,10 +806,12 @@ class TerminalDialog(QWidget):
         layout = QVBoxLayout()
 
         # 终端输出文本框
-        self.terminal_output = QTextEdit()
+        self.terminal_output = QPlainTextEdit()
         self.terminal_output.setReadOnly(True)
+        # 限制输出行数，防止内存占用过大（超出时自动丢弃最早的行）
+        self.terminal_output.setMaximumBlockCount(self.MAX_LINES)
         self.terminal_output.setStyleSheet("""
-            QTextEdit {
+            QPlainTextEdit {
                 background-color: #1e1e1e;
                 color: #00ff00;
                 font-family: 'Courier New', monospace;
@@ -325,68 +839,269 @@ class TerminalDialog(QWidget):
 
         self.setLayout(layout)
 
+        # 输出先缓存，由定时器批量写入，合并重绘
+        self._pending = []
+        self._flush_timer = QTimer(self)
+        self._flush_timer.timeout.connect(self._flush)
+        self._flush_timer.start(self.FLUSH_INTERVAL)
+
     def append_output(self, text, is_error=False):
-        """添加输出文本"""
+        """添加输出文本（缓存后批量显示）"""
         if not text or not text.strip():
             return
-
-        cursor = self.terminal_output.textCursor()
-        cursor.movePosition(QTextCursor.End)
-        self.terminal_output.setTextCursor(cursor)
-
-        # 根据内容类型设置颜色
-        if is_error or '[ERROR]' in text or '[WARN' in text:
-            # 错误和警告信息用黄色/橙色显示
-            if '[ERROR]' in text:
-                self.terminal_output.setTextColor(Qt.red)
-            else:
-                self.terminal_output.setTextColor(QColor(255, 165, 0))  # 橙色
-        elif '[INFO]' in text or 'started' in text.lower() or 'ready' in text.lower():
-            # 信息用亮绿色显示
-            self.terminal_output.setTextColor(QColor(0, 255, 0))
+        self._pending.append((text, is_error))
+
+    @classmethod
+    def _line_color(cls, text, is_error):
+        """返回错误/警告信息的显示颜色，普通信息返回None（使用默认的绿色）"""
+        m = _LEVEL_RE.search(text)
+        if m:
+            return cls._COLORS[m.lastgroup]
+        return cls._COLORS['WARN'] if is_error else None
+
+    def _flush(self):
+        """将缓存的输出写入终端，相同颜色的连续输出合并为一次追加"""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+
+        run, run_color = [], None
+        for text, is_error in pending:
+            color = self._line_color(text, is_error)
+            if run and color != run_color:
+                self._append_run(run, run_color)
+                run = []
+            run.append(text)
+            run_color = color
+        self._append_run(run, run_color)
+
+    def _append_run(self, lines, color):
+        """追加一段同色的输出"""
+        text = "\n".join(lines)
+        if color is None:
+            # 纯文本中的换行会分成独立的块，受最大块数限制
+            self.terminal_output.appendPlainText(text)
         else:
-            # 正常信息用绿色显示
-            self.terminal_output.setTextColor(Qt.green)
-
-        self.terminal_output.insertPlainText(text + "\n")
-
-        # 滚动到底部
-        scrollbar = self.terminal_output.verticalScrollBar()
-        scrollbar.setValue(scrollbar.maximum())
-
-        # 限制输出行数，防止内存占用过大
-        document = self.terminal_output.document()
-        if document.lineCount() > 1000:
-            cursor = self.terminal_output.textCursor()
-            cursor.movePosition(QTextCursor.Start)
-            cursor.movePosition(QTextCursor.Down, QTextCursor.KeepAnchor, 100)
-            cursor.removeSelectedText()
+            # <br>不会分块，逐行追加才能让最大块数限制对彩色输出同样生效
+            for line in text.splitlines():
+                self.terminal_output.appendHtml(
+                    f'<span style="color:{color}; white-space:pre-wrap;">{html.escape(line)}</span>')
 
     def clear_output(self):
         """清空输出"""
+        self._pending = []
         self.terminal_output.clear()
 
 
+class PointCloudItem(GLGraphicsItem):
+    """点云显示项：点坐标常驻GPU显存(VBO)，只在数据变化时上传；按高度着色在着色器中完成"""
+
+    # 顶点着色器：根据z和高度范围计算彩虹色（与原先CPU端的着色公式一致）；
+    # 变换矩阵通过u_mvp传入，不依赖固定管线矩阵（pyqtgraph 0.14起不再设置）
+    _VERTEX_SHADER = """
+        #version 120
+        attribute vec3 a_position;
+        uniform mat4 u_mvp;
+        uniform float zMin;
+        uniform float zRange;
+        varying vec4 color;
+        void main() {
+            float t = clamp((a_position.z - zMin) / zRange, 0.0, 1.0);
+            color = vec4(t, 1.0 - 0.5 * t, 1.0 - t, 1.0);
+            gl_Position = u_mvp * vec4(a_position, 1.0);
+        }
+    """
+    _FRAGMENT_SHADER = """
+        #version 120
+        varying vec4 color;
+        void main() {
+            gl_FragColor = color;
+        }
+    """
+
+    def __init__(self, pos=None, size=3, glOptions='opaque'):
+        super().__init__()
+        self.setGLOptions(glOptions)
+        self.size = size  # 点大小（像素）
+        self.z_min = 0.0
+        self.z_range = 1.0
+        self._program = None
+        self._pos_vbo = None
+        self._count = 0  # 已上传到VBO的点数
+        self._capacity = 0  # VBO容量（点数）
+        self._queued = 0  # 已上传和待上传的点数
+        self._realloc = False  # 下次绘制时是否需要重新分配VBO
+        self._uploads = []  # 待上传的 (偏移, 坐标)
+        if pos is not None:
+            self.setData(pos=pos)
+
+    def setData(self, pos=None, size=None):
+        """替换全部点云数据，实际上传推迟到下一次绘制（需要当前GL上下文）"""
+        if size is not None:
+            self.size = size
+        if pos is not None:
+            pos = np.ascontiguousarray(pos, dtype=np.float32)
+            self.reserve(len(pos))
+            self.appendData(pos)
+        self.update()
+
+    def setHeightRange(self, z_min, z_max):
+        """设置着色使用的高度范围，只更新着色器参数，不重新上传数据"""
+        self.z_min = float(z_min)
+        self.z_range = float(z_max - z_min) if z_max > z_min else 1.0
+        self.update()
+
+    def reserve(self, capacity):
+        """清空点云并按容量重新分配VBO，之后可用appendData分块追加"""
+        self._capacity = capacity
+        self._queued = 0
+        self._realloc = True
+        self._uploads = []
+        self.update()
+
+    def appendData(self, pos):
+        """在已分配的VBO末尾追加一块点，超出容量的部分会被丢弃"""
+        n = min(len(pos), self._capacity - self._queued)
+        if n <= 0:
+            return
+        self._uploads.append((self._queued, np.ascontiguousarray(pos[:n], dtype=np.float32)))
+        self._queued += n
+        self.update()
+
+    def _upload(self):
+        """将待上传的数据写入VBO"""
+        if self._pos_vbo is None:
+            self._pos_vbo = GL.glGenBuffers(1)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self._pos_vbo)
+        if self._realloc:
+            # 整块上传时直接用数据初始化，避免先分配再拷贝
+            whole = (len(self._uploads) == 1 and self._uploads[0][0] == 0
+                     and len(self._uploads[0][1]) == self._capacity)
+            data = self._uploads.pop()[1] if whole else None
+            GL.glBufferData(GL.GL_ARRAY_BUFFER, self._capacity * 12, data, GL.GL_STATIC_DRAW)
+            self._count = self._capacity if whole else 0
+            self._realloc = False
+
+        for offset, pos in self._uploads:
+            GL.glBufferSubData(GL.GL_ARRAY_BUFFER, offset * 12, pos.nbytes, pos)
+            self._count = offset + len(pos)
+        self._uploads = []
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+
+    def _mvp(self):
+        """当前的模型-视图-投影矩阵，按列存储的float32数组"""
+        if hasattr(self, 'mvpMatrix'):
+            # pyqtgraph 0.14起矩阵由GLViewWidget在Python中维护
+            return np.array(self.mvpMatrix().data(), dtype=np.float32)
+        # 旧版本的矩阵设置在固定管线中（相当于ftransform()）；glGetFloatv得到的是转置，
+        # 转置后 MV^T · P^T = (P · MV)^T，按行展开即为按列存储的 P · MV
+        projection = np.asarray(GL.glGetFloatv(GL.GL_PROJECTION_MATRIX), dtype=np.float32).reshape(4, 4)
+        modelview = np.asarray(GL.glGetFloatv(GL.GL_MODELVIEW_MATRIX), dtype=np.float32).reshape(4, 4)
+        return np.ascontiguousarray(modelview @ projection)
+
+    def paint(self):
+        if self._realloc or self._uploads:
+            self._upload()
+        if self._count == 0:
+            return
+        self.setupGLState()
+
+        if self._program is None:
+            self._program = shaders.compileProgram(
+                shaders.compileShader(self._VERTEX_SHADER, GL.GL_VERTEX_SHADER),
+                shaders.compileShader(self._FRAGMENT_SHADER, GL.GL_FRAGMENT_SHADER))
+
+        GL.glUseProgram(self._program)
+        GL.glUniformMatrix4fv(GL.glGetUniformLocation(self._program, 'u_mvp'), 1, GL.GL_FALSE, self._mvp())
+        GL.glUniform1f(GL.glGetUniformLocation(self._program, 'zMin'), self.z_min)
+        GL.glUniform1f(GL.glGetUniformLocation(self._program, 'zRange'), self.z_range)
+        GL.glPointSize(self.size)
+        # 通过通用顶点属性读取VBO中的坐标，不使用固定管线的顶点数组
+        loc = GL.glGetAttribLocation(self._program, 'a_position')
+        GL.glEnableVertexAttribArray(loc)
+        try:
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self._pos_vbo)
+            GL.glVertexAttribPointer(loc, 3, GL.GL_FLOAT, GL.GL_FALSE, 0, None)
+            GL.glDrawArrays(GL.GL_POINTS, 0, self._count)
+        finally:
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+            GL.glDisableVertexAttribArray(loc)
+            GL.glUseProgram(0)
+
+
 class PCDViewer(QMainWindow):
+    _RAD2DEG = 180.0 / math.pi  # 弧度转角度系数
+    SHUTDOWN_TIMEOUT = 2000  # 停止后台线程时等待其退出的最长时间（毫秒）
+    _GPS_LINE_TEMPLATE = "{}\t{}\t{}\t{}\t{}\t{}\t{}\n"  # 时间 经度 纬度 高度 Roll Pitch Yaw
+
+    # 定位状态标签样式：状态 -> (背景色, 文字颜色)
+    _STATUS_COLORS = {
+        'idle': ('#f0f0f0', '#666'),
+        'starting': ('#fff3cd', '#856404'),
+        'running': ('#d4edda', '#155724'),
+        'stopped': ('#f8d7da', '#721c24'),
+    }
+    _STATUS_STYLE = """
+        QLabel {{
+            padding: 10px;
+            background-color: {};
+            border-radius: 3px;
+            color: {};
+            font-weight: bold;
+        }}
+    """
+
     def __init__(self):
         super().__init__()
         self.point_cloud_data = None
+        self._stats_cache = None  # 当前点云的 (mins, maxs, mean)
         self.default_pcd_path = "/media/dzt/pym/tingchechang.pcd"  # 默认PCD文件路径
         self.gps_file_path = "/media/dzt/pym/gps_coordinates.txt"  # GPS坐标保存路径
         self.ndt_path = "/media/dzt/pym/NDT"  # NDT路径
         self.max_display_points = 20000000  # 默认最大显示点数
+        self.voxel_target_points = 2000000  # 超过该点数时先做体素下采样再上传GPU
+        self.pcd_loader = None  # 当前的点云加载线程
+        self._pcd_generation = 0  # 当前加载的编号，每次开始或取消加载时加一
+        self._pcd_loaders = set()  # 尚未结束的加载线程（含已取消的），结束后才释放
+        self._pcd_file_path = None  # 当前正在加载的文件
+        self._rng = np.random.default_rng()  # 随机数生成器（示例数据、主线程中的下采样）
+
+        # GPS记录文件句柄常驻；写入失败的记录留在队列中，下次保存时重试
+        self._gps_fh = None
+        self._gps_pending = []
+        self._gps_latest = None
+        self._gps_latest_path = os.path.join(os.path.dirname(self.gps_file_path), "latest_gps.txt")
+        # 启动时确保GPS保存目录存在，保存时不再检查
+        try:
+            os.makedirs(os.path.dirname(self.gps_file_path), exist_ok=True)
+        except OSError as e:
+            print(f"创建GPS保存目录失败: {e}")
 
         # ROS启动相关
         self.ros_launcher = None
+        # 预先生成各状态的样式表，状态不变时不重复设置（避免Qt重新解析样式）
+        self._status_styles = {key: self._STATUS_STYLE.format(bg, fg)
+                               for key, (bg, fg) in self._STATUS_COLORS.items()}
+        self._status_key = None
         self.is_localization_running = False
         self.terminal_dialog = None
 
         # ROS订阅相关
         self.ros_subscriber = None
         self.is_pose_subscription_active = False
+        self.pose_topic = "/kalman_filtered_pose"  # 位姿话题
+        self.pose_is_quaternion = False  # 话题的orientation是否为标准四元数
+
+        # 位姿显示节流：订阅线程只缓存位姿，由定时器按固定频率刷新界面
+        self._shown_pose = None
+        self.pose_refresh_interval = 50  # 毫秒，20Hz
 
         self.initUI()
 
+        self._ui_timer = QTimer(self)
+        self._ui_timer.timeout.connect(self._flush_pose)
+        self._ui_timer.start(self.pose_refresh_interval)
+
         # 自动启动ROS位姿订阅
         self.start_pose_subscription()
 
@@ -554,16 +1269,8 @@ class PCDViewer(QMainWindow):
         self.btn_reset_view.clicked.connect(self.reset_view)
 
         # 定位状态标签
-        self.localization_status = QLabel("定位状态: 未启动")
-        self.localization_status.setStyleSheet("""
-            QLabel {
-                padding: 10px;
-                background-color: #f0f0f0;
-                border-radius: 3px;
-                color: #666;
-                font-weight: bold;
-            }
-        """)
+        self.localization_status = QLabel()
+        self.set_localization_status("定位状态: 未启动", 'idle')
 
         # 位姿订阅状态标签
         self.pose_status = QLabel("位姿订阅: 正在连接...")
@@ -589,6 +1296,11 @@ class PCDViewer(QMainWindow):
             }
         """)
 
+        # 点云加载进度，仅在加载过程中显示
+        self.load_progress = QProgressBar()
+        self.load_progress.setTextVisible(True)
+        self.load_progress.hide()
+
         # 添加点云信息显示
         self.info_label = QLabel("点云信息：\n点数：0")
         self.info_label.setStyleSheet("""
@@ -678,6 +1390,16 @@ class PCDViewer(QMainWindow):
         """)
         self.btn_save_gps.clicked.connect(self.save_gps_coordinates)
 
+        # latest_gps.txt 中的键 -> 输入框
+        self._gps_fields = {
+            "经度": self.longitude_input,
+            "纬度": self.latitude_input,
+            "高度": self.altitude_input,
+            "Roll": self.roll_input,
+            "Pitch": self.pitch_input,
+            "Yaw": self.yaw_input,
+        }
+
         # 加载已保存的GPS坐标
         self.load_gps_coordinates()
 
@@ -700,6 +1422,7 @@ class PCDViewer(QMainWindow):
         layout.addWidget(self.btn_reset_view)
         layout.addWidget(QLabel("当前文件："))
         layout.addWidget(self.file_label)
+        layout.addWidget(self.load_progress)
         layout.addWidget(QLabel(""))  # 空白间隔
         layout.addWidget(self.info_label)
         layout.addWidget(gps_group)
@@ -716,19 +1439,22 @@ class PCDViewer(QMainWindow):
         w.opts['center'] = Vector(0, 0, 0)  # 设置初始中心点
         w.setBackgroundColor('w')
 
-        # 添加网格
-        grid = gl.GLGridItem()
-        grid.scale(10, 10, 1)
-        w.addItem(grid)
+        # 添加网格（后续调整视角时复用同一个网格）
+        self._grid_item = gl.GLGridItem()
+        self._grid_item.scale(10, 10, 1)
+        w.addItem(self._grid_item)
 
         # 添加坐标轴
         axis = gl.GLAxisItem()
         axis.setSize(20, 20, 20)
         w.addItem(axis)
 
+        # 点云显示项，后续加载的点云都复用它
+        self.scatter_plot = PointCloudItem(size=3, glOptions='opaque')
+        w.addItem(self.scatter_plot)
+
         # 保存为属性以便后续使用
         self.view_widget = w
-        self.scatter_plot = None
 
         return w
 
@@ -777,6 +1503,11 @@ class PCDViewer(QMainWindow):
             # 添加到主布局
             layout.addLayout(param_layout)
 
+        # 按固定顺序缓存输入框及显示格式，避免每次更新时查字典
+        self._pose_fields = [(self.pose_inputs[k], fmt) for k, fmt in
+                             zip(('x', 'y', 'z', 'roll', 'pitch', 'yaw'),
+                                 ('.3f', '.3f', '.3f', '.2f', '.2f', '.2f'))]
+
         panel.setLayout(layout)
         return panel
 
@@ -800,10 +1531,9 @@ class PCDViewer(QMainWindow):
 
         try:
             # 创建ROS订阅线程
-            self.ros_subscriber = ROSSubscriberThread("/kalman_filtered_pose")
+            self.ros_subscriber = ROSSubscriberThread(self.pose_topic, self.pose_is_quaternion)
 
             # 连接信号
-            self.ros_subscriber.pose_signal.connect(self.update_pose_from_ros, Qt.QueuedConnection)
             self.ros_subscriber.error_signal.connect(self.on_pose_error, Qt.QueuedConnection)
             self.ros_subscriber.connected_signal.connect(self.on_pose_connected, Qt.QueuedConnection)
 
@@ -842,7 +1572,9 @@ class PCDViewer(QMainWindow):
         # 先停止现有订阅
         if self.ros_subscriber:
             self.ros_subscriber.stop()
-            self.ros_subscriber.wait()
+            # 旧线程每0.5秒检查一次停止标志，超时只记录，它退出前不影响新订阅
+            if not self.ros_subscriber.wait(self.SHUTDOWN_TIMEOUT):
+                print("旧的位姿订阅线程未能及时退出")
             self.ros_subscriber = None
 
         self.is_pose_subscription_active = False
@@ -864,16 +1596,22 @@ class PCDViewer(QMainWindow):
             }
         """)
 
-    @pyqtSlot(float, float, float, float, float, float)
-    def update_pose_from_ros(self, x, y, z, roll, pitch, yaw):
-        """从ROS话题更新位姿显示"""
+    def _flush_pose(self):
+        """从订阅线程的环形缓冲读取最新位姿并刷新显示框，位姿未变化时不做任何操作"""
+        ring = self.ros_subscriber.pose_ring if self.ros_subscriber else None
+        if not ring:
+            return
+        pose = ring[-1]
+        if pose == self._shown_pose:
+            return
+
         try:
-            self.pose_inputs['x'].setText(f"{x:.3f}")
-            self.pose_inputs['y'].setText(f"{y:.3f}")
-            self.pose_inputs['z'].setText(f"{z:.3f}")
-            self.pose_inputs['roll'].setText(f"{math.degrees(roll):.2f}")  # 转换为角度
-            self.pose_inputs['pitch'].setText(f"{math.degrees(pitch):.2f}")  # 转换为角度
-            self.pose_inputs['yaw'].setText(f"{math.degrees(yaw):.2f}")  # 转换为角度
+            x, y, z, roll, pitch, yaw = pose
+            k = self._RAD2DEG
+            vals = (x, y, z, roll * k, pitch * k, yaw * k)  # 角度转换为度
+            for (field, fmt), v in zip(self._pose_fields, vals):
+                field.setText(format(v, fmt))
+            self._shown_pose = pose
 
         except Exception as e:
             print(f"更新位姿显示失败: {e}")
@@ -904,23 +1642,26 @@ class PCDViewer(QMainWindow):
 
     def load_sample_pointcloud(self):
         """加载示例点云数据"""
-        # 生成示例点云数据（一个立方体）
-        n_points = 1000
-        points = np.random.randn(n_points, 3) * 10
+        # 生成示例点云数据：一次性预分配并填充标准正态分布，再按区段原地变换
+        n_points, n_ground, n_wall = 1000, 500, 300
+        points = np.empty((n_points + n_ground + n_wall, 3), dtype=np.float32)
+        self._rng.standard_normal(dtype=np.float32, out=points)
+
+        # 随机散点
+        points[:n_points] *= 10
 
-        # 添加一些结构
         # 地面
-        ground = np.random.randn(500, 3)
-        ground[:, 2] = -5 + np.random.randn(500) * 0.5
+        ground = points[n_points:n_points + n_ground]
         ground[:, :2] *= 20
+        ground[:, 2] *= 0.5
+        ground[:, 2] -= 5
 
         # 墙壁
-        wall = np.random.randn(300, 3)
-        wall[:, 0] = 15 + np.random.randn(300) * 0.5
+        wall = points[n_points + n_ground:]
+        wall[:, 0] *= 0.5
+        wall[:, 0] += 15
         wall[:, 1] *= 10
-        wall[:, 2] = wall[:, 2] * 3
-
-        points = np.vstack([points, ground, wall])
+        wall[:, 2] *= 3
 
         self.display_pointcloud(points)
         self.update_info(len(points), len(points))
@@ -946,36 +1687,29 @@ class PCDViewer(QMainWindow):
                 lon_val = float(longitude)
                 lat_val = float(latitude)
                 alt_val = float(altitude)
-                roll_val = float(roll) if roll else 0.0
-                pitch_val = float(pitch) if pitch else 0.0
-                yaw_val = float(yaw) if yaw else 0.0
+                roll_val = self._optional_float(roll)
+                pitch_val = self._optional_float(pitch)
+                yaw_val = self._optional_float(yaw)
             except ValueError:
                 QMessageBox.warning(self, "警告", "请输入有效的数值！")
                 return
 
             # 保存到文件
-            import datetime
-            timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-            # 确保目录存在
-            save_dir = os.path.dirname(self.gps_file_path)
-            if not os.path.exists(save_dir):
-                os.makedirs(save_dir, exist_ok=True)
-
-            # 写入文件（追加模式）
-            with open(self.gps_file_path, 'a', encoding='utf-8') as f:
-                f.write(f"{timestamp}\t{longitude}\t{latitude}\t{altitude}\t{roll_val}\t{pitch_val}\t{yaw_val}\n")
-
-            # 同时保存一个最新的GPS坐标文件（覆盖模式）
-            latest_file = os.path.join(save_dir, "latest_gps.txt")
-            with open(latest_file, 'w', encoding='utf-8') as f:
-                f.write(f"经度: {longitude}\n")
-                f.write(f"纬度: {latitude}\n")
-                f.write(f"高度: {altitude}\n")
-                f.write(f"Roll: {roll_val}\n")
-                f.write(f"Pitch: {pitch_val}\n")
-                f.write(f"Yaw: {yaw_val}\n")
-                f.write(f"时间: {timestamp}\n")
+            t = datetime.now()
+            timestamp = (f"{t.year:04d}-{t.month:02d}-{t.day:02d} "
+                         f"{t.hour:02d}:{t.minute:02d}:{t.second:02d}")
+
+            # 写入文件成功后才提示保存成功（失败时由下面的异常处理提示）
+            self._gps_pending.append(self._GPS_LINE_TEMPLATE.format(
+                timestamp, longitude, latitude, altitude, roll_val, pitch_val, yaw_val))
+            self._gps_latest = (f"经度: {longitude}\n"
+                                f"纬度: {latitude}\n"
+                                f"高度: {altitude}\n"
+                                f"Roll: {roll_val}\n"
+                                f"Pitch: {pitch_val}\n"
+                                f"Yaw: {yaw_val}\n"
+                                f"时间: {timestamp}\n")
+            self._flush_gps()
 
             QMessageBox.information(self, "成功",
                                     f"GPS坐标与姿态已保存！\n"
@@ -994,32 +1728,61 @@ class PCDViewer(QMainWindow):
             QMessageBox.critical(self, "错误", f"保存GPS坐标失败：\n{str(e)}")
             print(f"保存GPS坐标失败: {e}")
 
+    @staticmethod
+    def _optional_float(text):
+        """把可选填写的输入转换为浮点数，空白时为0.0"""
+        text = text.strip()
+        return float(text) if text else 0.0
+
+    def _flush_gps(self):
+        """将排队的GPS记录写入文件，失败时抛出异常，记录保留在队列中"""
+        if not self._gps_pending and self._gps_latest is None:
+            return
+
+        # 写入文件（追加模式，文件句柄常驻）
+        if self._gps_pending:
+            try:
+                if self._gps_fh is None:
+                    self._gps_fh = open(self.gps_file_path, 'a', encoding='utf-8', buffering=65536)
+                self._gps_fh.writelines(self._gps_pending)
+                self._gps_fh.flush()
+            except Exception:
+                # 丢弃可能已失效的句柄，下次写入时重新打开
+                if self._gps_fh is not None:
+                    try:
+                        self._gps_fh.close()
+                    except OSError:
+                        pass
+                    self._gps_fh = None
+                raise
+            self._gps_pending.clear()
+
+        # 同时保存一个最新的GPS坐标文件（覆盖模式，先写临时文件再替换）
+        if self._gps_latest is not None:
+            tmp_file = self._gps_latest_path + ".tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                f.write(self._gps_latest)
+            os.replace(tmp_file, self._gps_latest_path)
+            self._gps_latest = None
+
     def load_gps_coordinates(self):
         """加载最近保存的GPS坐标和姿态"""
         try:
-            latest_file = os.path.join(os.path.dirname(self.gps_file_path), "latest_gps.txt")
+            latest_file = self._gps_latest_path
             if os.path.exists(latest_file):
                 with open(latest_file, 'r', encoding='utf-8') as f:
-                    lines = f.readlines()
-                    for line in lines:
-                        if line.startswith("经度:"):
-                            self.longitude_input.setText(line.split(":")[1].strip())
-                        elif line.startswith("纬度:"):
-                            self.latitude_input.setText(line.split(":")[1].strip())
-                        elif line.startswith("高度:"):
-                            self.altitude_input.setText(line.split(":")[1].strip())
-                        elif line.startswith("Roll:"):
-                            self.roll_input.setText(line.split(":")[1].strip())
-                        elif line.startswith("Pitch:"):
-                            self.pitch_input.setText(line.split(":")[1].strip())
-                        elif line.startswith("Yaw:"):
-                            self.yaw_input.setText(line.split(":")[1].strip())
+                    for line in f:
+                        key, _, value = line.partition(":")
+                        field = self._gps_fields.get(key.strip())
+                        if field is not None:
+                            field.setText(value.strip())
                 print("已加载上次保存的GPS坐标和姿态")
         except Exception as e:
             print(f"加载GPS坐标失败: {e}")
 
-    def display_pointcloud(self, points, auto_adjust=True):
-        """显示点云数据 - 修复版本"""
+    def display_pointcloud(self, points, auto_adjust=True, upload=True, display_points=None, stats=None):
+        """显示点云数据 - 修复版本（upload为False表示显存中已是同样的点，只更新着色和视角；
+        display_points/stats已在加载线程中算好时直接使用）"""
         # 检查数据有效性
         if points is None or len(points) == 0:
             print("警告: 点云数据为空！")
@@ -1027,68 +1790,42 @@ class PCDViewer(QMainWindow):
 
         print(f"准备显示 {len(points)} 个点")
 
-        # 使用固定的最大显示点数
-        max_points = self.max_display_points
-
-        # 如果点云太大，进行下采样
-        display_points = points
-        if len(points) > max_points:
-            print(f"点云过大，下采样到 {max_points} 个点")
-            indices = np.random.choice(len(points), max_points, replace=False)
-            display_points = points[indices]
-
-        # 移除旧的点云
-        if self.scatter_plot is not None:
-            self.view_widget.removeItem(self.scatter_plot)
-
-        # 确保数据类型正确
-        display_points = display_points.astype(np.float32)
-
-        # 创建颜色（根据高度着色）
-        z = display_points[:, 2]
-        if z.max() - z.min() > 0:
-            z_norm = (z - z.min()) / (z.max() - z.min())  # 归一化到0-1
-        else:
-            z_norm = np.zeros_like(z)
-
-        # 创建彩虹色映射
-        colors = np.zeros((len(display_points), 4))
-        colors[:, 0] = z_norm  # R
-        colors[:, 1] = 1 - z_norm * 0.5  # G
-        colors[:, 2] = 1 - z_norm  # B
-        colors[:, 3] = 1.0  # Alpha
-
-        # 创建散点图 - 使用更大的点尺寸和不同的渲染方式
-        self.scatter_plot = gl.GLScatterPlotItem(
-            pos=display_points,
-            color=colors.astype(np.float32),
-            size=3,  # 增大点的尺寸
-            pxMode=True,  # 使用像素模式
-            glOptions='opaque'  # 使用不透明渲染
-        )
-
-        # 添加到视图
-        self.view_widget.addItem(self.scatter_plot)
+        # 一次扫描得到范围和中心，下采样、着色、视角和信息显示共用
+        if stats is None:
+            stats = point_cloud_stats(points)
+        self._stats_cache = stats
+
+        if display_points is None:
+            # 如果点云太大，进行体素下采样（每个体素保留一个点，比随机下采样分布更均匀）
+            max_points = min(self.voxel_target_points, self.max_display_points)
+            display_points = points
+            if len(points) > max_points:
+                display_points = voxel_downsample(points, max_points, self._rng, stats)
+                print(f"点云过大，体素下采样: {len(points)} -> {len(display_points)} 个点")
+
+        # 确保数据类型正确（已是连续float32时不会复制）
+        display_points = to_gl_array(display_points)
+
+        # 复用同一个点云显示项，只替换VBO中的数据；颜色按高度在着色器中计算
+        if upload:
+            self.scatter_plot.setData(pos=display_points)
+        self.scatter_plot.setHeightRange(stats[0][2], stats[1][2])
         self.point_cloud_data = points  # 保存原始数据
 
         # 自动调整视角
         if auto_adjust:
-            self.auto_adjust_view(display_points)
+            self.auto_adjust_view(stats)
 
         # 强制更新显示
         self.view_widget.update()
 
         print(f"成功显示点云，实际显示 {len(display_points)} 个点")
+        return len(display_points)
 
-    def auto_adjust_view(self, points):
-        """自动调整视角以适应点云 - 改进版本"""
-        if len(points) == 0:
-            return
-
-        # 计算点云中心和范围
-        center = np.mean(points, axis=0)
-        min_vals = np.min(points, axis=0)
-        max_vals = np.max(points, axis=0)
+    def auto_adjust_view(self, stats):
+        """自动调整视角以适应点云 - 改进版本（stats为point_cloud_stats的结果）"""
+        # 点云中心和范围
+        min_vals, max_vals, center = stats
         ranges = max_vals - min_vals
         max_range = np.max(ranges)
 
@@ -1105,33 +1842,20 @@ class PCDViewer(QMainWindow):
         # 设置视图中心点
         self.view_widget.opts['center'] = Vector(float(center[0]), float(center[1]), float(center[2]))
 
-        # 更新网格
-        for item in self.view_widget.items[:]:  # 创建副本以避免迭代时修改
-            if isinstance(item, gl.GLGridItem):
-                self.view_widget.removeItem(item)
-
-        # 添加新的网格
-        grid = gl.GLGridItem()
-        grid.setSize(max_range * 2, max_range * 2, 1)
-        grid.setSpacing(max_range / 10, max_range / 10, 1)
-        grid.translate(center[0], center[1], min_vals[2] - 1)  # 将网格放在点云下方
-        self.view_widget.addItem(grid)
+        # 更新网格，将网格放在点云下方
+        self._grid_item.resetTransform()
+        self._grid_item.setSize(max_range * 2, max_range * 2, 1)
+        self._grid_item.setSpacing(max_range / 10, max_range / 10, 1)
+        self._grid_item.translate(center[0], center[1], min_vals[2] - 1)
 
         print(f"视角已调整 - 中心: {center}, 距离: {distance}, 范围: {ranges}")
 
     def reset_view(self):
         """重置视角"""
-        if self.point_cloud_data is not None:
-            # 重新调整到当前点云
-            max_points = self.max_display_points
-
-            display_points = self.point_cloud_data
-            if len(self.point_cloud_data) > max_points:
-                indices = np.random.choice(len(self.point_cloud_data), max_points, replace=False)
-                display_points = self.point_cloud_data[indices]
-
-            # 重新显示点云
-            self.display_pointcloud(display_points, auto_adjust=True)
+        if self._stats_cache is not None:
+            # 显存中的点云不变，只需按缓存的范围重新调整视角
+            self.auto_adjust_view(self._stats_cache)
+            self.view_widget.update()
         else:
             # 默认视角
             self.view_widget.setCameraPosition(distance=100, elevation=30, azimuth=45)
@@ -1141,9 +1865,8 @@ class PCDViewer(QMainWindow):
         """更新点云信息显示"""
         self.info_label.setText(f"点云信息：\n总点数：{total_points:,}\n显示点数：{display_points:,}")
 
-        if self.point_cloud_data is not None:
-            min_vals = np.min(self.point_cloud_data, axis=0)
-            max_vals = np.max(self.point_cloud_data, axis=0)
+        if self._stats_cache is not None:
+            min_vals, max_vals, _ = self._stats_cache
             self.info_label.setText(
                 f"点云信息：\n"
                 f"总点数：{total_points:,}\n"
@@ -1171,6 +1894,7 @@ class PCDViewer(QMainWindow):
             # 确保使用Qt的信号槽机制，避免线程问题
             self.ros_launcher.output_signal.connect(self.on_ros_output, Qt.QueuedConnection)
             self.ros_launcher.error_signal.connect(self.on_ros_error, Qt.QueuedConnection)
+            self.ros_launcher.notice_signal.connect(self.on_ros_notice, Qt.QueuedConnection)
             self.ros_launcher.finished_signal.connect(self.on_ros_finished, Qt.QueuedConnection)
 
             # 设置线程优先级，避免阻塞主线程
@@ -1183,16 +1907,7 @@ class PCDViewer(QMainWindow):
             self.is_localization_running = True
             self.btn_start_localization.setEnabled(False)
             self.btn_stop_localization.setEnabled(True)
-            self.localization_status.setText("定位状态: 正在启动...")
-            self.localization_status.setStyleSheet("""
-                QLabel {
-                    padding: 10px;
-                    background-color: #fff3cd;
-                    border-radius: 3px;
-                    color: #856404;
-                    font-weight: bold;
-                }
-            """)
+            self.set_localization_status("定位状态: 正在启动...", 'starting')
 
             # 显示终端窗口（只在点击定位启动时才显示）
             self.show_terminal()
@@ -1218,16 +1933,15 @@ class PCDViewer(QMainWindow):
             self.is_localization_running = False
             self.btn_start_localization.setEnabled(True)
             self.btn_stop_localization.setEnabled(False)
-            self.localization_status.setText("定位状态: 已停止")
-            self.localization_status.setStyleSheet("""
-                QLabel {
-                    padding: 10px;
-                    background-color: #f8d7da;
-                    border-radius: 3px;
-                    color: #721c24;
-                    font-weight: bold;
-                }
-            """)
+            self.set_localization_status("定位状态: 已停止", 'stopped')
+
+    def set_localization_status(self, text, key):
+        """更新定位状态标签，key为_STATUS_COLORS中的状态名"""
+        if self.localization_status.text() != text:
+            self.localization_status.setText(text)
+        if self._status_key != key:
+            self.localization_status.setStyleSheet(self._status_styles[key])
+            self._status_key = key
 
     def show_terminal(self):
         """显示终端窗口"""
@@ -1242,36 +1956,30 @@ class PCDViewer(QMainWindow):
         if self.terminal_dialog:
             self.terminal_dialog.append_output(text, is_error=False)
 
-        # 检查是否成功启动
-        if "started" in text.lower() or "ready" in text.lower() or "load" in text.lower():
-            self.localization_status.setText("定位状态: 运行中")
-            self.localization_status.setStyleSheet("""
-                QLabel {
-                    padding: 10px;
-                    background-color: #d4edda;
-                    border-radius: 3px;
-                    color: #155724;
-                    font-weight: bold;
-                }
-            """)
+        # 一次信号可能包含多行，按行依次判断，以最后一次匹配的状态为准
+        status = None
+        for line in text.lower().splitlines():
+            # 检查是否成功启动
+            if "started" in line or "ready" in line or "load" in line:
+                status = "定位状态: 运行中"
 
-        # 检查是否正在加载地图
-        if "load" in text.lower() and ".pcd" in text.lower():
-            self.localization_status.setText("定位状态: 正在加载地图...")
+            # 检查是否正在加载地图
+            if "load" in line and ".pcd" in line:
+                status = "定位状态: 正在加载地图..."
+        if status is not None:
+            self.set_localization_status(status, 'running')
 
     @pyqtSlot(str)
     def on_ros_error(self, text):
-        """处理ROS错误输出"""
+        """处理ROS错误输出（不重要的警告已在启动线程中分到notice_signal）"""
         if self.terminal_dialog:
-            # 过滤掉一些不重要的警告
-            if "disk usage" in text.lower() or "rosclean" in text.lower():
-                # 这只是磁盘空间警告，不是真正的错误
-                self.terminal_dialog.append_output(text, is_error=False)
-            elif "jsk_rviz_plugin" in text:
-                # 这是插件警告，通常不影响功能
-                self.terminal_dialog.append_output(text, is_error=False)
-            else:
-                self.terminal_dialog.append_output(text, is_error=True)
+            self.terminal_dialog.append_output(text, is_error=True)
+
+    @pyqtSlot(str)
+    def on_ros_notice(self, text):
+        """处理可忽略的ROS警告（磁盘空间、插件警告），按普通信息显示"""
+        if self.terminal_dialog:
+            self.terminal_dialog.append_output(text, is_error=False)
 
     @pyqtSlot(bool)
     def on_ros_finished(self, success):
@@ -1285,71 +1993,116 @@ class PCDViewer(QMainWindow):
         self.is_localization_running = False
         self.btn_start_localization.setEnabled(True)
         self.btn_stop_localization.setEnabled(False)
-        self.localization_status.setText("定位状态: 未启动")
-        self.localization_status.setStyleSheet("""
-            QLabel {
-                padding: 10px;
-                background-color: #f0f0f0;
-                border-radius: 3px;
-                color: #666;
-                font-weight: bold;
-            }
-        """)
+        self.set_localization_status("定位状态: 未启动", 'idle')
 
     def load_pcd_file(self, file_path):
-        """加载PCD文件 - 修复版本"""
-        try:
-            points = None
-
-            if HAS_OPEN3D and file_path.endswith(('.pcd', '.ply')):
-                # 使用Open3D读取PCD文件
-                print(f"使用Open3D读取文件：{file_path}")
-                pcd = o3d.io.read_point_cloud(file_path)
-                points = np.asarray(pcd.points)
-
-                # 确保点云数据是float32类型
-                points = points.astype(np.float32)
-
-                print(f"成功读取 {len(points)} 个点")
-                print(f"点云范围：X[{points[:, 0].min():.2f}, {points[:, 0].max():.2f}], "
-                      f"Y[{points[:, 1].min():.2f}, {points[:, 1].max():.2f}], "
-                      f"Z[{points[:, 2].min():.2f}, {points[:, 2].max():.2f}]")
-
-            elif file_path.endswith(('.txt', '.xyz')):
-                # 读取文本格式的点云文件
-                print(f"读取文本文件：{file_path}")
-                points = np.loadtxt(file_path)
-                if points.ndim == 2 and points.shape[1] >= 3:
-                    points = points[:, :3].astype(np.float32)  # 只取前三列(x,y,z)
-                else:
-                    raise ValueError("文本文件格式不正确")
-            else:
-                raise ValueError(f"不支持的文件格式：{file_path}")
-
-            if points is not None and len(points) > 0:
-                # 显示点云
-                self.display_pointcloud(points, auto_adjust=True)
-
-                # 更新信息
-                max_display = self.max_display_points
-
-                actual_display = min(len(points), max_display)
-                self.update_info(len(points), actual_display)
-
-                # 更新文件路径显示
-                filename = os.path.basename(file_path)
-                self.file_label.setText(filename)
-
-                print(f"点云加载成功：总共 {len(points):,} 个点")
-                # 静默显示加载信息，不弹出对话框
-            else:
-                raise ValueError("点云数据为空")
+        """在后台线程中加载点云文件，读取过程中渐进显示"""
+        # 取消正在进行的加载
+        self.stop_pcd_loading()
+
+        print(f"开始加载点云文件：{file_path}")
+        self._pcd_generation += 1
+        self._pcd_file_path = file_path
+        loader = PCDLoaderThread(file_path, min(self.voxel_target_points, self.max_display_points),
+                                 self._pcd_generation)
+        loader.total_signal.connect(self.on_pcd_total, Qt.QueuedConnection)
+        loader.chunk_signal.connect(self.on_pcd_chunk, Qt.QueuedConnection)
+        loader.loaded_signal.connect(self.on_pcd_loaded, Qt.QueuedConnection)
+        loader.error_signal.connect(self.on_pcd_error, Qt.QueuedConnection)
+        # 线程结束后再释放，取消的加载不在主线程中等待
+        loader.finished.connect(lambda: self._release_pcd_loader(loader), Qt.QueuedConnection)
+        self._pcd_loaders.add(loader)
+        self.pcd_loader = loader
+        loader.start()
+
+        self.file_label.setText(f"正在加载：{os.path.basename(file_path)}")
+        # 总点数未知前显示为忙碌状态
+        self.load_progress.setRange(0, 0)
+        self.load_progress.show()
+
+    def stop_pcd_loading(self):
+        """取消正在进行的点云加载（不等待线程退出，之后它发来的信号都会被忽略）"""
+        if self.pcd_loader is not None:
+            self.pcd_loader.stop()
+            self.pcd_loader = None
+        self._pcd_generation += 1
+        self.load_progress.hide()
+
+    def _release_pcd_loader(self, loader):
+        """加载线程结束后释放"""
+        self._pcd_loaders.discard(loader)
+        if loader is self.pcd_loader:
+            self.pcd_loader = None
+        loader.deleteLater()
+
+    @pyqtSlot(int, int)
+    def on_pcd_total(self, generation, total):
+        """开始接收点云：按预计点数分配显示缓冲，超大点云按步长抽稀预览"""
+        if generation != self._pcd_generation:
+            return
+        self._preview_step = max(1, math.ceil(total / self.voxel_target_points))
+        self._preview_adjusted = False
+        self.scatter_plot.reserve(math.ceil(total / self._preview_step))
+        self.load_progress.setRange(0, max(total, 1))
+        self.load_progress.setValue(0)
+
+    @pyqtSlot(int, object)
+    def on_pcd_chunk(self, generation, chunk):
+        """渐进显示新读取的一块点云"""
+        if generation != self._pcd_generation:
+            return
+        pts = chunk[::self._preview_step]
+        self.scatter_plot.appendData(pts)
+        self.load_progress.setValue(self.load_progress.value() + len(chunk))
+
+        if not self._preview_adjusted:
+            # 用第一块的高度范围临时着色，加载完成后再按完整范围着色；
+            # 预览块是跨步视图，直接用numpy统计，并行内核只在加载线程中调用
+            stats = (pts.min(axis=0), pts.max(axis=0), pts.mean(axis=0, dtype=np.float64))
+            self.scatter_plot.setHeightRange(stats[0][2], stats[1][2])
+            self.auto_adjust_view(stats)
+            self._preview_adjusted = True
+
+    @pyqtSlot(int, object, object, object)
+    def on_pcd_loaded(self, generation, points, display_points, stats):
+        """点云读取完成：使用加载线程下采样后的点着色并更新信息"""
+        if generation != self._pcd_generation:
+            return
+        # 加载线程可能还在写缓存文件，不在这里等待它退出
+        file_path = self._pcd_file_path
+        self.load_progress.hide()
+
+        # 显示点云：渐进预览已包含全部点且无需下采样时，不再重复上传
+        preview_complete = self._preview_step == 1 and len(display_points) == len(points)
+        actual_display = self.display_pointcloud(points, auto_adjust=True, upload=not preview_complete,
+                                                 display_points=display_points, stats=stats)
+
+        min_vals, max_vals, _ = self._stats_cache
+        print(f"点云范围：X[{min_vals[0]:.2f}, {max_vals[0]:.2f}], "
+              f"Y[{min_vals[1]:.2f}, {max_vals[1]:.2f}], "
+              f"Z[{min_vals[2]:.2f}, {max_vals[2]:.2f}]")
+
+        # 更新信息
+        self.update_info(len(points), actual_display)
+
+        # 更新文件路径显示
+        filename = os.path.basename(file_path)
+        self.file_label.setText(filename)
+
+        print(f"点云加载成功：总共 {len(points):,} 个点")
+        # 静默显示加载信息，不弹出对话框
+
+    @pyqtSlot(int, str)
+    def on_pcd_error(self, generation, error_msg):
+        """点云加载失败"""
+        if generation != self._pcd_generation:
+            return
+        self.stop_pcd_loading()
 
-        except Exception as e:
-            print(f"加载文件失败：{str(e)}")
-            QMessageBox.critical(self, "错误", f"加载文件失败：\n{str(e)}")
-            # 加载示例数据
-            self.load_sample_pointcloud()
+        print(f"加载文件失败：{error_msg}")
+        QMessageBox.critical(self, "错误", f"加载文件失败：\n{error_msg}")
+        # 加载示例数据
+        self.load_sample_pointcloud()
 
     def load_map(self):
         """加载PCD地图文件"""
@@ -1381,16 +2134,42 @@ class PCDViewer(QMainWindow):
                                          QMessageBox.No)
 
             if reply == QMessageBox.Yes:
-                self.ros_launcher.stop()
+                self.ros_launcher.stop(timeout=self.SHUTDOWN_TIMEOUT / 1000)
+                # 读取循环每10ms检查一次停止标志，超时只记录，不强制结束线程
+                if not self.ros_launcher.wait(self.SHUTDOWN_TIMEOUT):
+                    print("ROS启动线程未能及时退出")
                 event.accept()
             else:
                 event.ignore()
                 return
 
+        # 停止点云加载，所有加载线程（含之前取消的）共用一个等待时限
+        self.stop_pcd_loading()
+        deadline = time.monotonic() + self.SHUTDOWN_TIMEOUT / 1000
+        for loader in list(self._pcd_loaders):
+            remaining = max(0, int((deadline - time.monotonic()) * 1000))
+            if not loader.wait(remaining):
+                print(f"点云加载线程未能及时退出：{loader.file_path}")
+
+        # 写入之前失败的GPS记录并关闭文件
+        try:
+            self._flush_gps()
+        except Exception as e:
+            print(f"保存GPS坐标失败: {e}")
+        if self._gps_fh is not None:
+            self._gps_fh.close()
+            self._gps_fh = None
+
         # 停止位姿订阅
         if self.ros_subscriber:
             self.ros_subscriber.stop()
-            self.ros_subscriber.wait()
+            # 订阅线程是守护线程，超时后随进程退出，不再等待
+            if not self.ros_subscriber.wait(self.SHUTDOWN_TIMEOUT):
+                print("位姿订阅线程未能及时退出")
+
+        # 整个程序退出时才关闭ROS节点
+        if HAS_ROS and rospy.get_node_uri():
+            rospy.signal_shutdown("PCD viewer closed")
 
         event.accept()
 